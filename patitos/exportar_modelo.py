@@ -0,0 +1,31 @@
+from ultralytics import YOLO
+from pathlib import Path
+import torch
+
+# --- Parámetros de exportación ---
+# Ejecutar una sola vez tras el entrenamiento; visionPatitos.py carga el resultado si existe
+MODEL_PATH = '/Users/jorgenajera/Documents/Duck_vision/patitos_detector/yolov8n_patitos2/weights/best.pt'
+IMG_SIZE = 640       # Tamaño de imagen usado en el entrenamiento
+BATCH_SIZE = 4       # Lote máximo de inferencia (igual a BATCH_SIZE en visionPatitos.py)
+
+def export_fast_model(weights_path):
+    """Exporta el modelo a TensorRT FP16 (con GPU) u OpenVINO FP16 (en CPU)"""
+    weights = Path(weights_path)
+    if not weights.is_file():
+        print(f"Error: No se encontró el modelo: {weights}")
+        return False
+
+    export_format = 'engine' if torch.cuda.is_available() else 'openvino'
+    print(f"Exportando {weights.name} a formato {export_format}...")
+    try:
+        # dynamic=True para aceptar el último lote incompleto del video
+        output = YOLO(str(weights)).export(format=export_format, half=True, imgsz=IMG_SIZE,
+                                           batch=BATCH_SIZE, dynamic=True)
+        print(f"Modelo exportado en: {output}")
+        return True
+    except Exception as e:
+        print(f"Error al exportar a {export_format}: {e}")
+        return False
+
+if __name__ == "__main__":
+    export_fast_model(MODEL_PATH)
@@ -1,93 +1,196 @@
 import cv2
+import queue
+import threading
+from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial import cKDTree
+import torch
 from ultralytics import YOLO
 import supervision as sv
+try:
+    import decord  # decodificador de video opcional, más rápido que cv2.VideoCapture
+except ImportError:
+    decord = None
+try:
+    from numba import njit  # compilación JIT opcional del cálculo de distancias
+except ImportError:
+    njit = None
 from typing import List, Tuple
 
 # --- Parámetros ajustables ---
 VIDEO_PATH = 'patitos.mp4'
+MODEL_PATH = '/Users/jorgenajera/Documents/Duck_vision/patitos_detector/yolov8n_patitos2/weights/best.pt'
 AREA_THRESHOLD = 500      # área mínima para considerar un contorno
-HOUGH_THRESH = 150        # umbral de HoughLines
+HOUGH_THRESH = 50         # umbral de votos de HoughLinesP (por segmento, no por línea completa)
 GRID_SQUARE_CM = 10.0     # tamaño real de cada cuadrado de la malla
+GRID_ROI = None           # región (y0, y1, x0, x1) donde está la malla; None = frame completo
+GRID_MIN_STD = 10.0       # desviación estándar mínima de gris para intentar calibrar
+GRID_MERGE_PX = 10        # filas a menos de esta distancia (px) se consideran la misma línea
 CONFIDENCE_THRESH = 0.5   # umbral de confianza para detecciones YOLO
 IOU_THRESH = 0.5          # umbral IoU para NMS
+MAX_MATCH_DIST = 100      # distancia máxima (px) para asociar una detección a una trayectoria
+KDTREE_MIN_TRACKS = 20    # a partir de cuántas trayectorias se usa KD-tree en vez del algoritmo húngaro
+BATCH_SIZE = 4            # frames por llamada a YOLO (inferencia por lotes)
+QUEUE_SIZE = 3            # capacidad de las colas entre hilos
+TRAJ_CHUNK = 64           # capacidad inicial del buffer de cada trayectoria en cm (se duplica al llenarse)
+
+# --- Distancias entre centroides ---
+def _pairwise_distances_numpy(prev, cur):
+    """Matriz de distancias euclidianas (N x M) entre centroides, con broadcasting"""
+    return np.sqrt(((prev[:, None, :] - cur[None, :, :]) ** 2).sum(-1))
+
+def _pairwise_distances_loop(prev, cur):
+    """Matriz de distancias euclidianas (N x M) con doble ciclo explícito, para compilar con Numba"""
+    n, m = prev.shape[0], cur.shape[0]
+    out = np.empty((n, m), dtype=np.float32)
+    for i in range(n):
+        for j in range(m):
+            dx = prev[i, 0] - cur[j, 0]
+            dy = prev[i, 1] - cur[j, 1]
+            out[i, j] = np.sqrt(dx * dx + dy * dy)
+    return out
+
+if njit is not None:
+    pairwise_distances = njit(cache=True)(_pairwise_distances_loop)
+else:
+    pairwise_distances = _pairwise_distances_numpy
+
+def match_hungarian(prev, cur, max_dist):
+    """Asignación óptima (algoritmo húngaro) entre trayectorias y detecciones a menos de max_dist"""
+    distances = pairwise_distances(prev, cur)
+
+    # Los pares demasiado lejanos se penalizan y luego se descartan
+    distances_gated = np.where(distances < max_dist, distances, 1e6)
+    row_ind, col_ind = linear_sum_assignment(distances_gated)
+    keep = distances[row_ind, col_ind] < max_dist
+    return row_ind[keep], col_ind[keep]
+
+def match_kdtree(prev, cur, max_dist):
+    """Asigna a cada detección su trayectoria más cercana con un KD-tree; en colisiones gana la más cercana"""
+    tree = cKDTree(prev)
+    dists, idx = tree.query(cur, k=1, distance_upper_bound=max_dist)
+
+    # idx == tree.n indica que no hay trayectoria dentro del umbral (objeto nuevo)
+    cols = np.nonzero(dists < max_dist)[0]
+    cols = cols[np.argsort(dists[cols], kind='stable')]
+    rows = idx[cols]
+
+    # Conservar solo la primera (más cercana) detección de cada trayectoria
+    _, first = np.unique(rows, return_index=True)
+    return rows[first], cols[first]
 
 # --- Clase para seguimiento de objetos ---
+class GrowableBuffers:
+    """Buffers NumPy por ID (filas de ancho fijo) que duplican su capacidad al llenarse"""
+    def __init__(self, width, capacity=64):
+        self.width = width  # columnas por fila
+        self.capacity = capacity  # capacidad inicial (y mínima) de cada buffer
+        self.data = {}  # {id: array (capacidad, width) float32}
+        self.lengths = {}  # {id: número de filas válidas}
+
+    def __len__(self):
+        return len(self.data)
+
+    def keys(self):
+        return self.data.keys()
+
+    def append(self, key, row):
+        """Agrega una fila al buffer del ID; crecimiento geométrico para que la copia sea O(n) amortizado"""
+        buf = self.data.get(key)
+        n = self.lengths.get(key, 0)
+        if buf is None or n == len(buf):
+            grown = np.empty((max(2 * n, self.capacity), self.width), dtype=np.float32)
+            if buf is not None:
+                grown[:n] = buf
+            self.data[key] = buf = grown
+        buf[n] = row
+        self.lengths[key] = n + 1
+
+    def last(self, key):
+        """Última fila válida del ID"""
+        return self.data[key][self.lengths[key] - 1]
+
+    def views(self):
+        """Vistas {id: array (n, width)} con solo las filas válidas"""
+        return {key: buf[:self.lengths[key]] for key, buf in self.data.items()}
+
+    def remove(self, key):
+        del self.data[key]
+        del self.lengths[key]
+
 class PathTracker:
-    def __init__(self):
-        self.paths = {}  # diccionario para almacenar trayectorias
+    def __init__(self, capacity=64):
+        self.xy = GrowableBuffers(2, capacity)  # centroides (cx, cy) de cada trayectoria
+        self.meta = GrowableBuffers(2, capacity)  # (conf, cls) de cada punto
         self.disappeared = {}  # contador de frames desaparecidos
         self.next_id = 0  # próximo ID a asignar
         self.max_disappeared = 10  # máximo de frames para mantener un ID desaparecido
+
+    @property
+    def paths(self):
+        """Trayectorias activas como vistas {id: array (n, 2)} sobre los buffers"""
+        return self.xy.views()
+
+    def _register(self, detection):
+        """Crea una trayectoria nueva a partir de una detección"""
+        obj_id = self.next_id
+        self.disappeared[obj_id] = 0
+        self.next_id += 1
+        self._append(obj_id, detection)
+
+    def _append(self, obj_id, detection):
+        """Agrega una detección a los buffers de la trayectoria"""
+        cx, cy, conf, cls = detection
+        self.xy.append(obj_id, (cx, cy))
+        self.meta.append(obj_id, (conf, cls))
+
+    def _mark_disappeared(self, obj_id):
+        """Incrementa el contador de desaparición y elimina el ID si expira"""
+        self.disappeared[obj_id] += 1
+        if self.disappeared[obj_id] > self.max_disappeared:
+            self.xy.remove(obj_id)
+            self.meta.remove(obj_id)
+            del self.disappeared[obj_id]
     
     def update(self, detections):
         # Si no hay detecciones, incrementar contadores de desaparición
         if len(detections) == 0:
             for obj_id in list(self.disappeared.keys()):
-                self.disappeared[obj_id] += 1
-                if self.disappeared[obj_id] > self.max_disappeared:
-                    del self.paths[obj_id]
-                    del self.disappeared[obj_id]
+                self._mark_disappeared(obj_id)
             return self.paths
         
         # Si es la primera detección, inicializar los objetos
-        if len(self.paths) == 0:
+        if len(self.xy) == 0:
             for detection in detections:
-                self.paths[self.next_id] = [detection]
-                self.disappeared[self.next_id] = 0
-                self.next_id += 1
+                self._register(detection)
         else:
             # Calcular distancias entre detecciones actuales y trayectorias existentes
-            object_ids = list(self.paths.keys())
-            previous_centroids = [self.paths[obj_id][-1] for obj_id in object_ids]
-            
-            # Matriz de distancias entre detecciones actuales y objetos existentes
-            distances = np.zeros((len(previous_centroids), len(detections)))
-            for i, prev_centroid in enumerate(previous_centroids):
-                for j, detection in enumerate(detections):
-                    distances[i, j] = np.linalg.norm(
-                        np.array(prev_centroid[:2]) - np.array(detection[:2])
-                    )
-            
-            # Asignar detecciones a trayectorias existentes
-            rows_idx = list(range(distances.shape[0]))
-            cols_idx = list(range(distances.shape[1]))
-            
-            if distances.size > 0:
-                # Mientras haya posibles asignaciones
-                while len(rows_idx) > 0 and len(cols_idx) > 0:
-                    # Encontrar par con menor distancia
-                    if len(rows_idx) > 0 and len(cols_idx) > 0:
-                        min_idx = np.argmin(distances[rows_idx, :][:, cols_idx])
-                        i, j = np.unravel_index(min_idx, (len(rows_idx), len(cols_idx)))
-                        row, col = rows_idx[i], cols_idx[j]
-                        
-                        # Si la distancia es razonable, asignar
-                        if distances[row, col] < 100:  # umbral de distancia máxima
-                            self.paths[object_ids[row]].append(detections[col])
-                            self.disappeared[object_ids[row]] = 0
-                            rows_idx.pop(i)
-                            cols_idx.pop(j)
-                        else:
-                            # No hay buenas asignaciones restantes
-                            break
-                    else:
-                        break
-            
+            object_ids = list(self.xy.keys())
+            prev = np.stack([self.xy.last(obj_id) for obj_id in object_ids])  # N x 2
+            cur = np.asarray([d[:2] for d in detections], dtype=np.float32)  # M x 2
+
+            # Con muchas trayectorias el KD-tree evita construir la matriz N x M completa
+            if len(object_ids) > KDTREE_MIN_TRACKS:
+                rows, cols = match_kdtree(prev, cur, MAX_MATCH_DIST)
+            else:
+                rows, cols = match_hungarian(prev, cur, MAX_MATCH_DIST)
+
+            for row, col in zip(rows.tolist(), cols.tolist()):
+                self._append(object_ids[row], detections[col])
+                self.disappeared[object_ids[row]] = 0
+
+            rows_idx = sorted(set(range(len(prev))) - set(rows.tolist()))
+            cols_idx = sorted(set(range(len(cur))) - set(cols.tolist()))
+
             # Manejar detecciones no asignadas (nuevos objetos)
             for col in cols_idx:
-                self.paths[self.next_id] = [detections[col]]
-                self.disappeared[self.next_id] = 0
-                self.next_id += 1
+                self._register(detections[col])
             
             # Manejar objetos sin detecciones (desaparecidos)
             for row in rows_idx:
-                obj_id = object_ids[row]
-                self.disappeared[obj_id] += 1
-                if self.disappeared[obj_id] > self.max_disappeared:
-                    del self.paths[obj_id]
-                    del self.disappeared[obj_id]
+                self._mark_disappeared(object_ids[row])
         
         return self.paths
 
@@ -100,158 +203,42 @@ def calculate_speed(points: List[Tuple[float, float]], time_diff: float) -> floa
     distance = np.hypot(p2[0] - p1[0], p2[1] - p1[1])  # en cm
     return distance / time_diff  # cm/s
 
-def draw_grid(frame, lines, color=(0, 255, 255), thickness=1):
-    """Dibuja la cuadrícula detectada por HoughLines"""
-    if lines is None:
+def draw_grid(frame, segments, color=(0, 255, 255), thickness=1):
+    """Dibuja los segmentos de la cuadrícula detectados por HoughLinesP"""
+    if segments is None:
         return
     
-    h, w = frame.shape[:2]  
-    for line in lines:
-        rho, theta = line[0]
-        a = np.cos(theta)
-        b = np.sin(theta)
-        x0 = a * rho
-        y0 = b * rho
-        x1 = int(x0 + 1000 * (-b))
-        y1 = int(y0 + 1000 * (a))
-        x2 = int(x0 - 1000 * (-b))
-        y2 = int(y0 - 1000 * (a))
+    for x1, y1, x2, y2 in segments.tolist():
         cv2.line(frame, (x1, y1), (x2, y2), color, thickness)
 
-# --- Inicializaciones ---
-cap = cv2.VideoCapture(VIDEO_PATH)
-if not cap.isOpened():
-    print("Error al abrir el video.")
-    exit()
-
-# Inicializar modelo YOLO
-print("Cargando modelo YOLOv8...")
-model = YOLO("/Users/jorgenajera/Documents/Duck_vision/patitos_detector/yolov8n_patitos2/weights/best.pt")  # Modelo base, ajusta según necesidades
-
-# Configurar seguimiento de trayectorias
-tracker = PathTracker()
-
-# Variables para el sistema de coordenadas
-pixel_per_cm = None
-fps = cap.get(cv2.CAP_PROP_FPS)
-dt = 1.0 / fps  # tiempo entre frames
-
-# Variables para almacenar trayectorias
-trajectories_cm = {}  # {id: [(x_cm, y_cm, frame_num), ...]}
-
-frame_count = 0
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-    
-    frame_count += 1
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
-    edges = cv2.Canny(blur, 50, 150)
-    
-    # 1) Calcular escala (pix/cm) usando la cuadrícula
-    lines = None
-    if pixel_per_cm is None:
-        lines = cv2.HoughLines(edges, 1, np.pi / 180, HOUGH_THRESH)
-        if lines is not None:
-            rhos = [l[0][0] for l in lines if abs(np.sin(l[0][1])) > 0.9]
-            rhos_uniq = sorted(set(int(round(r)) for r in rhos))
-            if len(rhos_uniq) >= 2:
-                diffs = np.diff(rhos_uniq)
-                median_pix = np.median(diffs)
-                pixel_per_cm = median_pix / GRID_SQUARE_CM
-                print(f"Escala: {pixel_per_cm:.2f} pixeles/cm")
-    
-    # Dibujar cuadrícula si está disponible
-    if lines is not None:
-        draw_grid(frame, lines)
-    
-    # 2) Detectar patitos con YOLOv8
-    results = model(frame, conf=CONFIDENCE_THRESH, iou=IOU_THRESH, classes=[0])  # clase 0 = persona, ajustar para patitos
-    
-    # Procesar las detecciones
-    detections = []
-    for r in results:
-        boxes = r.boxes
-        for box in boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            conf = box.conf[0].item()
-            cls = int(box.cls[0].item())
-            
-            # Solo procesar detecciones relevantes (ajustar según las clases que detecte tu modelo)
-            if cls == 0:  # persona, pájaro, o lo que corresponda a patitos
-                cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-                w, h = x2 - x1, y2 - y1
-                area = w * h
-                
-                # Filtrar por área si es necesario
-                if area > AREA_THRESHOLD:
-                    detections.append((cx, cy, conf, cls))
-                    
-                    # Dibujar la detección en el frame
-                    label = f"Patito {conf:.2f}"
-                    cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                    cv2.putText(frame, label, (int(x1), int(y1 - 10)), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-    
-    # 3) Actualizar el seguimiento de trayectorias
-    paths = tracker.update(detections)
-    
-    # 4) Calcular y mostrar trayectorias y velocidades
-    if pixel_per_cm:
-        for obj_id, points in paths.items():
-            # Convertir últimos puntos a cm
-            if len(points) >= 2:
-                # Extraer centroide
-                cx1, cy1 = points[-2][:2]
-                cx2, cy2 = points[-1][:2]
-                
-                # Convertir a cm
-                x1_cm, y1_cm = cx1 / pixel_per_cm, cy1 / pixel_per_cm
-                x2_cm, y2_cm = cx2 / pixel_per_cm, cy2 / pixel_per_cm
-                
-                # Almacenar en trayectorias (en cm)
-                if obj_id not in trajectories_cm:
-                    trajectories_cm[obj_id] = []
-                trajectories_cm[obj_id].append((x2_cm, y2_cm, frame_count))
-                
-                # Calcular velocidad
-                speed = calculate_speed([(x1_cm, y1_cm), (x2_cm, y2_cm)], dt)
-                
-                # Dibujar línea de trayectoria
-                cv2.line(frame, (int(cx1), int(cy1)), (int(cx2), int(cy2)), (0, 0, 255), 2)
-                
-                # Mostrar ID y velocidad
-                cv2.putText(frame, f"ID: {obj_id}, v={speed:.1f} cm/s", 
-                            (int(cx2), int(cy2 - 20)), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-    
-    # Mostrar frame
-    cv2.imshow('Seguimiento de Patitos con YOLOv8', frame)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+def draw_detections(frame, xyxy, conf, color=(0, 255, 0)):
+    """Dibuja las cajas y etiquetas de las detecciones a partir de los arrays de YOLO"""
+    # Convertir coordenadas y etiquetas de una vez, sin accesos por caja a los arrays
+    boxes = xyxy.astype(np.int32).tolist()
+    labels = [f"Patito {c:.2f}" for c in conf.tolist()]
+    for (x1, y1, x2, y2), label in zip(boxes, labels):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
 
-cap.release()
-cv2.destroyAllWindows()
+def offset_segments(segments, x0, y0):
+    """Traslada segmentos (x1, y1, x2, y2) de coordenadas del ROI a coordenadas del frame completo"""
+    return segments + np.array([x0, y0, x0, y0], dtype=segments.dtype)
 
-# --- Gráfica final de trayectorias (en cm) ---
-if pixel_per_cm and trajectories_cm:
+def plot_trajectories(trajectories, fps):
+    """Grafica las trayectorias (en cm) con sus direcciones y la velocidad de cada patito en el tiempo"""
     plt.figure(figsize=(12, 8))
     
     # Graficar todas las trayectorias
-    for obj_id, traj in trajectories_cm.items():
+    for obj_id, traj in trajectories.items():
         if len(traj) < 2:
             continue
             
-        xs, ys, _ = zip(*traj)
+        xs, ys = traj[:, 0], traj[:, 1]
         plt.plot(xs, ys, '-o', label=f'Patito {obj_id}')
         
-        # Dibujar flechas de dirección
-        for i in range(len(xs)-1):
-            dx, dy = xs[i+1]-xs[i], ys[i+1]-ys[i]
-            plt.arrow(xs[i], ys[i], dx, dy,
-                      head_width=0.5, length_includes_head=True, alpha=0.6)
+        # Dibujar flechas de dirección (una sola llamada por trayectoria)
+        plt.quiver(xs[:-1], ys[:-1], np.diff(xs), np.diff(ys),
+                   angles='xy', scale_units='xy', scale=1, alpha=0.6)
     
     plt.gca().invert_yaxis()  # Invertir eje Y para coincidir con coordenadas de imagen
     plt.xlabel('X (cm)')
@@ -262,27 +249,20 @@ if pixel_per_cm and trajectories_cm:
     
     # Calcular velocidades medias
     plt.figure(figsize=(12, 6))
-    for obj_id, traj in trajectories_cm.items():
+    for obj_id, traj in trajectories.items():
         if len(traj) < 3:
             continue
             
-        speeds = []
-        times = []
-        xs, ys, frames = zip(*traj)
+        dx = np.diff(traj[:, 0])
+        dy = np.diff(traj[:, 1])
+        df = np.diff(traj[:, 2])
         
-        for i in range(1, len(traj)):
-            dx = xs[i] - xs[i-1]
-            dy = ys[i] - ys[i-1]
-            df = frames[i] - frames[i-1]
-            
-            if df > 0:  # evitar división por cero
-                dist = np.hypot(dx, dy)
-                time = df / fps
-                speed = dist / time
-                speeds.append(speed)
-                times.append(frames[i] / fps)  # tiempo en segundos
+        valid = df > 0  # evitar división por cero
+        dist = np.hypot(dx[valid], dy[valid])
+        speeds = dist / (df[valid] / fps)
+        times = traj[1:, 2][valid] / fps  # tiempo en segundos
         
-        if speeds:
+        if speeds.size:
             plt.plot(times, speeds, '-o', label=f'Patito {obj_id}')
     
     plt.xlabel('Tiempo (s)')
@@ -292,5 +272,274 @@ if pixel_per_cm and trajectories_cm:
     plt.legend()
     
     plt.show()
+
+def open_video(path):
+    """Abre el video con decord si está instalado (decodificación más rápida) o con cv2.VideoCapture"""
+    if decord is not None:
+        try:
+            video = decord.VideoReader(path, ctx=decord.cpu())
+            return video, video.get_avg_fps()
+        except Exception as e:
+            print(f"Error al abrir el video con decord: {e}. Usando OpenCV")
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return None, 0
+    return cap, cap.get(cv2.CAP_PROP_FPS)
+
+def iter_frames(video):
+    """Itera los frames del video en formato BGR"""
+    if isinstance(video, cv2.VideoCapture):
+        while True:
+            ret, frame = video.read()
+            if not ret:
+                break
+            yield frame
+    else:
+        for frame_t in video:
+            # decord entrega RGB; cvtColor devuelve además un array contiguo para dibujar
+            yield cv2.cvtColor(frame_t.asnumpy(), cv2.COLOR_RGB2BGR)
+
+def grid_row_rhos(segments):
+    """Distancia al origen (rho) de los segmentos casi horizontales, ordenada; equivale al rho de HoughLines"""
+    x1, y1, x2, y2 = segments.astype(np.float64).T
+    theta = np.arctan2(y2 - y1, x2 - x1) + np.pi / 2  # ángulo de la normal a cada segmento
+    rows = np.abs(np.sin(theta)) > 0.9
+    rhos = (x1 + x2) / 2 * np.cos(theta) + (y1 + y2) / 2 * np.sin(theta)
+    return np.sort(rhos[rows])
+
+def merge_close(values, tol):
+    """Agrupa valores ordenados separados por menos de tol (p. ej. los dos bordes de una línea) y devuelve sus medias"""
+    if len(values) == 0:
+        return values
+    groups = np.split(values, np.nonzero(np.diff(values) > tol)[0] + 1)
+    return np.array([g.mean() for g in groups])
+
+def capture_frames(video, frame_queue, stop_event, errors):
+    """Productor: lee frames del video en segundo plano y los encola como (frame_idx, frame)"""
+    try:
+        for frame_idx, frame in enumerate(iter_frames(video), start=1):
+            if stop_event.is_set() or not queue_put(frame_queue, (frame_idx, frame), stop_event):
+                return
+    except Exception as e:
+        errors.append(e)  # se relanza en el hilo principal
+        stop_event.set()
+    finally:
+        queue_put(frame_queue, None, stop_event)  # fin del video
+
+def queue_put(q, item, stop_event):
+    """Encola con espera, pero sin bloquearse si el pipeline ya se detuvo"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def queue_put_latest(q, item):
+    """Encola descartando el elemento más antiguo si la cola está llena"""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+def read_batches(frame_queue, batch_size, stop_event):
+    """Agrupa los frames de la cola en lotes para la inferencia con YOLO"""
+    batch = []
+    while not stop_event.is_set():
+        try:
+            item = frame_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is None:
+            break
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def load_model(weights_path):
+    """Carga el modelo exportado por exportar_modelo.py si existe (TensorRT con GPU, OpenVINO en CPU) o el .pt"""
+    weights = Path(weights_path)
+    if torch.cuda.is_available() and weights.with_suffix('.engine').exists():
+        return YOLO(str(weights.with_suffix('.engine')), task='detect')
+    openvino_dir = weights.parent / f"{weights.stem}_openvino_model"
+    if openvino_dir.exists():
+        return YOLO(str(openvino_dir), task='detect')
+    print(f"No se encontró un modelo exportado; usando {weights.name} (ejecuta exportar_modelo.py)")
+    return YOLO(str(weights))
+
+# --- Inicializaciones ---
+video, fps = open_video(VIDEO_PATH)
+if video is None:
+    print("Error al abrir el video.")
+    exit()
+
+# Inicializar modelo YOLO
+print("Cargando modelo YOLOv8...")
+model = load_model(MODEL_PATH)
+
+# Configurar seguimiento de trayectorias
+tracker = PathTracker()
+if njit is not None:
+    pairwise_distances(np.zeros((1, 2), np.float32), np.zeros((1, 2), np.float32))  # compilar antes del primer frame
+
+# Variables para el sistema de coordenadas
+pixel_per_cm = None
+dt = 1.0 / fps  # tiempo entre frames
+
+# Variables para almacenar trayectorias
+trajectories_cm = GrowableBuffers(3, TRAJ_CHUNK)  # {id: filas (x_cm, y_cm, frame_num)}
+
+def process_frames(frame_queue, display_queue, stop_event, errors):
+    """Consumidor: ejecuta YOLO + seguimiento y encola los frames anotados para mostrarlos"""
+    global pixel_per_cm
+    grid_segments = None  # últimos segmentos de HoughLinesP detectados
+    gray = None  # buffer en escala de grises reutilizado entre frames
+
+    try:
+        for batch in read_batches(frame_queue, BATCH_SIZE, stop_event):
+            batch_idx = [idx for idx, _ in batch]
+            batch_frames = [frame for _, frame in batch]
+
+            # Una sola llamada a YOLO por lote; devuelve un Results por frame
+            results = model(batch_frames, conf=CONFIDENCE_THRESH, iou=IOU_THRESH, classes=[0], verbose=False)  # clase 0 = persona, ajustar para patitos
+
+            for frame_count, frame, r in zip(batch_idx, batch_frames, results):
+                # 1) Calcular escala (pix/cm) usando la cuadrícula (solo hasta calibrar)
+                if pixel_per_cm is None:
+                    # Solo se procesa la región de la cuadrícula, sobre un buffer reutilizado
+                    roi = frame if GRID_ROI is None else frame[GRID_ROI[0]:GRID_ROI[1], GRID_ROI[2]:GRID_ROI[3]]
+                    if gray is None or gray.shape != roi.shape[:2]:
+                        gray = np.empty(roi.shape[:2], dtype=np.uint8)
+                    cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY, dst=gray)
+
+                    # Frames con poco contraste (oscuros o borrosos) no dan bordes útiles: se omiten
+                    segments = None
+                    if cv2.meanStdDev(gray)[1][0, 0] >= GRID_MIN_STD:
+                        cv2.GaussianBlur(gray, (5, 5), 0, dst=gray)
+                        edges = cv2.Canny(gray, 50, 150)
+                        segments = cv2.HoughLinesP(edges, 1, np.pi / 180, HOUGH_THRESH,
+                                                   minLineLength=gray.shape[1] // 10, maxLineGap=20)
+                    if segments is not None:
+                        segments = segments.reshape(-1, 4)  # (K, 1, 4) u (K, 4) según la versión de OpenCV
+                        if GRID_ROI is not None:
+                            segments = offset_segments(segments, GRID_ROI[2], GRID_ROI[0])
+                        grid_segments = segments
+                        # Filas de la malla (con perspectiva): segmentos a menos de ~25° de la horizontal
+                        rhos_uniq = merge_close(grid_row_rhos(segments), GRID_MERGE_PX)
+                        if len(rhos_uniq) >= 2:
+                            diffs = np.diff(rhos_uniq)
+                            median_pix = np.median(diffs)
+                            pixel_per_cm = median_pix / GRID_SQUARE_CM
+                            print(f"Escala: {pixel_per_cm:.2f} pixeles/cm")
+    
+                # Dibujar la última cuadrícula detectada (cacheada tras calibrar)
+                if grid_segments is not None:
+                    draw_grid(frame, grid_segments)
+    
+                # 2) Procesar las detecciones de YOLOv8 para este frame
+                # Una sola copia GPU->CPU por atributo en vez de una por caja
+                xyxy = r.boxes.xyxy.cpu().numpy()
+                conf = r.boxes.conf.cpu().numpy()
+                cls = r.boxes.cls.cpu().numpy().astype(np.int32)
+
+                cx = (xyxy[:, 0] + xyxy[:, 2]) * 0.5
+                cy = (xyxy[:, 1] + xyxy[:, 3]) * 0.5
+                area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+
+                # Solo detecciones relevantes (clase 0 = patito) y con área suficiente
+                mask = (cls == 0) & (area > AREA_THRESHOLD)
+
+                idx = mask.nonzero()[0]
+                detections = list(zip(cx[idx].tolist(), cy[idx].tolist(), conf[idx].tolist(), cls[idx].tolist()))
+
+                # Dibujar las detecciones en el frame
+                draw_detections(frame, xyxy[idx], conf[idx])
+    
+                # 3) Actualizar el seguimiento de trayectorias
+                paths = tracker.update(detections)
+    
+                # 4) Calcular y mostrar trayectorias y velocidades
+                if pixel_per_cm:
+                    for obj_id, points in paths.items():
+                        # Convertir últimos puntos a cm
+                        if len(points) >= 2:
+                            # Extraer centroide
+                            cx1, cy1 = points[-2][:2]
+                            cx2, cy2 = points[-1][:2]
+                
+                            # Convertir a cm
+                            x1_cm, y1_cm = cx1 / pixel_per_cm, cy1 / pixel_per_cm
+                            x2_cm, y2_cm = cx2 / pixel_per_cm, cy2 / pixel_per_cm
+                
+                            # Almacenar en trayectorias (en cm)
+                            trajectories_cm.append(obj_id, (x2_cm, y2_cm, frame_count))
+                
+                            # Calcular velocidad
+                            speed = calculate_speed([(x1_cm, y1_cm), (x2_cm, y2_cm)], dt)
+                
+                            # Dibujar línea de trayectoria
+                            cv2.line(frame, (int(cx1), int(cy1)), (int(cx2), int(cy2)), (0, 0, 255), 2)
+                
+                            # Mostrar ID y velocidad
+                            cv2.putText(frame, f"ID: {obj_id}, v={speed:.1f} cm/s", 
+                                        (int(cx2), int(cy2 - 20)), 
+                                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+    
+                # Enviar frame al hilo principal para mostrarlo
+                queue_put_latest(display_queue, frame)
+    except Exception as e:
+        errors.append(e)  # se relanza en el hilo principal
+        stop_event.set()
+    finally:
+        queue_put_latest(display_queue, None)  # fin del procesamiento (también si hubo un error)
+
+# Pipeline: captura (hilo) -> YOLO + seguimiento (hilo) -> visualización (hilo principal)
+frame_queue = queue.Queue(maxsize=QUEUE_SIZE)
+display_queue = queue.Queue(maxsize=QUEUE_SIZE)
+stop_event = threading.Event()
+worker_errors = []  # excepciones de los hilos de captura y procesamiento
+
+capture_thread = threading.Thread(target=capture_frames, args=(video, frame_queue, stop_event, worker_errors), daemon=True)
+process_thread = threading.Thread(target=process_frames, args=(frame_queue, display_queue, stop_event, worker_errors), daemon=True)
+capture_thread.start()
+process_thread.start()
+
+# cv2.imshow debe llamarse desde el hilo principal (requisito de macOS)
+while True:
+    frame = display_queue.get()
+    if frame is None:
+        break
+    cv2.imshow('Seguimiento de Patitos con YOLOv8', frame)
+    if cv2.waitKey(1) & 0xFF == ord('q'):
+        break
+
+stop_event.set()
+process_thread.join()
+capture_thread.join()
+
+if isinstance(video, cv2.VideoCapture):
+    video.release()
+cv2.destroyAllWindows()
+cv2.waitKey(1)  # procesar eventos para que la ventana del video se cierre antes de graficar
+
+# Propagar al hilo principal cualquier error de los hilos de trabajo
+if worker_errors:
+    raise worker_errors[0]
+
+# --- Gráfica final de trayectorias (en cm) ---
+# Vistas con solo los puntos válidos de cada buffer
+trajectories = trajectories_cm.views()
+
+if pixel_per_cm and trajectories:
+    plot_trajectories(trajectories, fps)
 else:
     print("No se pudieron graficar trayectorias.")
\ No newline at end of file